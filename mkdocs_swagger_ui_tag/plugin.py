@@ -1,7 +1,10 @@
+import concurrent.futures
 import hashlib
 import json
 import logging
 import os
+import re
+import shutil
 from urllib.parse import unquote as urlunquote
 from urllib.parse import urlsplit, urlunsplit
 
@@ -22,8 +25,37 @@ except ImportError:
     # compat
     log = logging.getLogger(f"mkdocs.plugins.{__name__}")  # type: ignore
 
+try:
+    # prefer the C-backed lxml parser, parsing is the hot path of this plugin
+    import lxml  # noqa: F401
+
+    html_parser = "lxml"
+except ImportError:
+    # compat
+    html_parser = "html.parser"
+
 base_path = os.path.dirname(os.path.abspath(__file__))
 
+# attributes in the order bs4 used to serialize them
+iframe_template = (
+    '<iframe class="swagger-ui-iframe" frameborder="0" id="{id}"'
+    " onload=\"this.style.display = 'block'; this.style.overflow ="
+    " 'hidden'; this.style.width = '100%';\" src=\"{src}\""
+    ' style="display:none;" width="100%"></iframe>'
+)
+
+# tag names are case-insensitive, so the fast-path gate must be too
+swagger_ui_open_re = re.compile(r"<swagger-ui", re.IGNORECASE)
+
+# matches self-closing, explicitly closed and bare-open swagger-ui tags
+swagger_ui_re = re.compile(
+    r"<swagger-ui\b[^>]*?(?:/>|>.*?</swagger-ui\s*>|>)",
+    re.DOTALL | re.IGNORECASE,
+)
+
+# commented-out tags are not elements and must not be processed
+comment_re = re.compile(r"<!--.*?-->", re.DOTALL)
+
 
 class SwaggerUIPlugin(BasePlugin):
     """Create Swagger UI with swagger-ui tag"""
@@ -72,15 +104,100 @@ class SwaggerUIPlugin(BasePlugin):
         ("defaultModelsExpandDepth", config_options.Type(int, default=1)),
     )
 
+    def on_config(self, config, **kwargs):
+        """Set up build-wide state shared by every page"""
+
+        # The template never changes during a build, so compile it once
+        # instead of once per page with a swagger-ui tag
+        self.env = Environment(
+            loader=FileSystemLoader(os.path.join(base_path, "swagger-ui")),
+            autoescape=select_autoescape(["html"]),
+            auto_reload=False,
+        )
+        self.template = self.env.get_template("swagger.html")
+        # Rendered iframe documents keyed by everything that feeds the
+        # template, so identical tags across pages render only once
+        self.render_cache = {}
+        self.written_files = set()
+        self.created_dirs = set()
+        # Resolved tag src urls keyed by (page src_path, raw url)
+        self.url_cache = {}
+        # Serialized option dicts, shared by tags with the same settings
+        self.options_json_cache = {}
+        self.oath2_json_cache = {}
+        # Iframe files are written off the page-processing thread; the
+        # writes release the GIL and are collected in on_post_build
+        self.write_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="swagger-ui-write"
+        )
+        self.write_futures = []
+        # The helper script only depends on the theme and plugin config,
+        # so build it once instead of concatenating it on every page
+        self.script_html = self.build_script_html(config)
+        # Flat (key, attribute name, coercer) tables so per-tag option
+        # handling avoids rebuilding dicts and branching on key names
+        skip_option_keys = ["background", "custom_css_files"]
+        self.global_options = {
+            k: v for k, v in dict(self.config).items() if k not in skip_option_keys
+        }
+        self.option_specs = [
+            (
+                k,
+                k.lower(),
+                self.coerce_submit_methods
+                if k == "supportedSubmitMethods"
+                else None,
+            )
+            for k in self.global_options
+        ]
+        oath_prop_keys = [
+            "clientId",
+            "clientSecret",
+            "realm",
+            "appName",
+            "scopes",
+            "additionalQueryStringParams",
+            "useBasicAuthenticationWithAccessCodeGrant",
+            "usePkceWithAuthorizationCodeGrant",
+        ]
+        bool_prop_keys = (
+            "useBasicAuthenticationWithAccessCodeGrant",
+            "usePkceWithAuthorizationCodeGrant",
+        )
+        self.oath2_prop_specs = []
+        for k in oath_prop_keys:
+            if k == "additionalQueryStringParams":
+                coerce = self.coerce_query_params
+            elif k in bool_prop_keys:
+                coerce = self.coerce_bool
+            else:
+                coerce = None
+            self.oath2_prop_specs.append((k, k.lower(), coerce))
+        return config
+
     def on_pre_page(self, page, config, files, **kwargs):
         """Add files for validate swagger-ui tag src"""
 
+        if getattr(self, "files", None) is not files:
+            # a new files collection invalidates cached resolutions
+            self.url_cache = {}
         self.files = files
         return page
 
     def path_to_url(self, page_file, url):
         """Validate swagger-ui tag src and parse url"""
 
+        cache_key = (page_file.src_path, url)
+        cached = self.url_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        resolved = self.resolve_url(page_file, url)
+        self.url_cache[cache_key] = resolved
+        return resolved
+
+    def resolve_url(self, page_file, url):
+        """Resolve a swagger-ui tag src relative to the page"""
+
         scheme, netloc, path, query, fragment = urlsplit(url)
 
         if (
@@ -128,44 +245,66 @@ class SwaggerUIPlugin(BasePlugin):
             if os.path.normpath(page.file.src_path) not in filter_list:
                 return output
 
-        soup = BeautifulSoup(output, "html.parser")
-        swagger_ui_list = soup.find_all("swagger-ui")
+        # Cheap scan before running the tag regex; the substring check
+        # catches the common lowercase form without a regex pass
+        if "<swagger-ui" not in output and not swagger_ui_open_re.search(output):
+            return output
+
+        # Locate the tags with a regex scan and parse only the matched
+        # fragments, instead of walking a tree built from the whole page
+        comment_spans = (
+            [m.span() for m in comment_re.finditer(output)]
+            if "<!--" in output
+            else []
+        )
+        swagger_ui_list = []
+        found_match = False
+        for match in swagger_ui_re.finditer(output):
+            found_match = True
+            if any(start <= match.start() < end for start, end in comment_spans):
+                continue
+            swagger_ui_ele = BeautifulSoup(match.group(0), html_parser).find(
+                "swagger-ui"
+            )
+            if swagger_ui_ele is not None:
+                swagger_ui_list.append((match, swagger_ui_ele))
 
         # No tags found, we can return earlier
         if len(swagger_ui_list) == 0:
+            if not found_match:
+                log.warning(
+                    f"Documentation file '{page.file.src_path}' contains "
+                    "'<swagger-ui' but no complete swagger-ui tag was recognized."
+                )
             return output
 
         # Regular processing
         iframe_id_list = []
         grouped_list = []
+        replacement_list = []
 
         log.info(f"Processing file '{page.file.src_uri}'")
-        css_dir = utils.get_relative_url(
-            utils.normalize_url("assets/stylesheets/"), page.url
-        )
-        js_dir = utils.get_relative_url(
-            utils.normalize_url("assets/javascripts/"), page.url
-        )
-        default_oauth2_redirect_file = utils.get_relative_url(
-            utils.normalize_url("assets/swagger-ui/oauth2-redirect.html"), page.url
-        )
-        env = Environment(
-            loader=FileSystemLoader(os.path.join(base_path, "swagger-ui")),
-            autoescape=select_autoescape(["html"]),
-        )
-        template = env.get_template("swagger.html")
-        extra_css_files = list(
-            map(
-                lambda f: utils.get_relative_url(utils.normalize_url(f), page.url),
-                self.config["extra_css"],
-            )
+        # All of these urls are relative to the same page, so compute the
+        # page-depth prefix once instead of going through the mkdocs url
+        # helpers for each of them
+        rel_prefix = "../" * page.url.count("/")
+        css_dir = rel_prefix + "assets/stylesheets/"
+        js_dir = rel_prefix + "assets/javascripts/"
+        default_oauth2_redirect_file = (
+            rel_prefix + "assets/swagger-ui/oauth2-redirect.html"
         )
+        template = self.template
+        normalize_url = utils.normalize_url
+        extra_css_files = [
+            rel_prefix + normalize_url(f) for f in self.config["extra_css"]
+        ]
 
         page_dir = os.path.dirname(
             os.path.join(config["site_dir"], urlunquote(page.url))
         )
-        if not os.path.exists(page_dir):
-            os.makedirs(page_dir)
+        if page_dir not in self.created_dirs:
+            os.makedirs(page_dir, exist_ok=True)
+            self.created_dirs.add(page_dir)
 
         def render_template(openapi_spec_url, swagger_ui_ele):
             cur_options = self.process_options(config, swagger_ui_ele)
@@ -174,58 +313,149 @@ class SwaggerUIPlugin(BasePlugin):
             if not oauth2_redirect_url:
                 oauth2_redirect_url = default_oauth2_redirect_file
 
-            template_output = template.render(
-                css_dir=css_dir,
-                extra_css_files=extra_css_files,
-                js_dir=js_dir,
-                background=self.config["background"],
-                id="{{ID_PLACEHOLDER}}",  # ID is unknown yet - it's the hash of the content.
-                openapi_spec_url=openapi_spec_url,
-                oauth2_redirect_url=oauth2_redirect_url,
-                validatorUrl=self.config["validatorUrl"],
-                options_str=json.dumps(cur_options, indent=4)[1:-1],
-                oath2_prop_str=json.dumps(cur_oath2_prop),
+            # Everything the template depends on; repr() keeps list and
+            # dict option values hashable
+            if isinstance(openapi_spec_url, str):
+                spec_key = openapi_spec_url
+            else:
+                spec_key = tuple(tuple(sorted(d.items())) for d in openapi_spec_url)
+            options_key = tuple(sorted((k, repr(v)) for k, v in cur_options.items()))
+            oath2_key = tuple(
+                sorted((k, repr(v)) for k, v in cur_oath2_prop.items())
+            )
+            cache_key = (
+                spec_key,
+                options_key,
+                oath2_key,
+                css_dir,
+                tuple(extra_css_files),
+                oauth2_redirect_url,
             )
-            cur_id = hashlib.sha256(template_output.encode()).hexdigest()[:8]
-            iframe_filename = f"swagger-{cur_id}.html"
-            template_output = template_output.replace("{{ID_PLACEHOLDER}}", cur_id)
-            with open(os.path.join(page_dir, iframe_filename), "w") as f:
-                f.write(template_output)
-            self.replace_with_iframe(soup, swagger_ui_ele, cur_id, iframe_filename)
-            return cur_id
-
-        for swagger_ui_ele in swagger_ui_list:
+            cached = self.render_cache.get(cache_key)
+            if cached is not None:
+                cur_id, iframe_filename, template_output = cached
+            else:
+                # The id is a function of the template inputs, so fingerprint
+                # the cache key and render once with the real id instead of
+                # hashing the output and patching in a placeholder.
+                # blake2b is faster than sha256 and 8 hex chars only need a
+                # 4-byte digest; this is a fingerprint, not a security hash
+                cur_id = hashlib.blake2b(
+                    repr(cache_key).encode("utf-8"), digest_size=4
+                ).hexdigest()
+                iframe_filename = f"swagger-{cur_id}.html"
+                options_str = self.options_json_cache.get(options_key)
+                if options_str is None:
+                    # the indent=4 pretty-printed form is part of the iframe
+                    # document format, so a compact serializer such as orjson
+                    # cannot be swapped in here; the cache keeps this off the
+                    # per-tag hot path
+                    options_str = json.dumps(cur_options, indent=4)[1:-1]
+                    self.options_json_cache[options_key] = options_str
+                oath2_prop_str = self.oath2_json_cache.get(oath2_key)
+                if oath2_prop_str is None:
+                    oath2_prop_str = json.dumps(cur_oath2_prop)
+                    self.oath2_json_cache[oath2_key] = oath2_prop_str
+                # keep the encoded bytes so cache hits skip re-encoding too
+                template_output = template.render(
+                    css_dir=css_dir,
+                    extra_css_files=extra_css_files,
+                    js_dir=js_dir,
+                    background=self.config["background"],
+                    id=cur_id,
+                    openapi_spec_url=openapi_spec_url,
+                    oauth2_redirect_url=oauth2_redirect_url,
+                    validatorUrl=self.config["validatorUrl"],
+                    options_str=options_str,
+                    oath2_prop_str=oath2_prop_str,
+                ).encode("utf-8")
+                self.render_cache[cache_key] = (
+                    cur_id,
+                    iframe_filename,
+                    template_output,
+                )
+            iframe_path = os.path.join(page_dir, iframe_filename)
+            if iframe_path not in self.written_files:
+                self.write_futures.append(
+                    self.write_executor.submit(
+                        self.write_iframe_file, iframe_path, template_output
+                    )
+                )
+                self.written_files.add(iframe_path)
+            return cur_id, iframe_filename
+
+        for match, swagger_ui_ele in swagger_ui_list:
             if swagger_ui_ele.has_attr("grouped"):
-                grouped_list.append(swagger_ui_ele)
+                grouped_list.append((match, swagger_ui_ele))
                 continue
 
             openapi_spec_url = self.path_to_url(
                 page.file, swagger_ui_ele.get("src", "")
             )
-            iframe_id_list.append(
-                render_template(
-                    openapi_spec_url=openapi_spec_url, swagger_ui_ele=swagger_ui_ele
-                )
+            cur_id, iframe_filename = render_template(
+                openapi_spec_url=openapi_spec_url, swagger_ui_ele=swagger_ui_ele
+            )
+            iframe_id_list.append(cur_id)
+            replacement_list.append(
+                (match, iframe_template.format(id=cur_id, src=iframe_filename))
             )
 
         if grouped_list:
             openapi_spec_url = []
-            for swagger_ui_ele in grouped_list:
+            for _, swagger_ui_ele in grouped_list:
                 cur_url = self.path_to_url(page.file, swagger_ui_ele.get("src", ""))
                 cur_name = swagger_ui_ele.get("name", swagger_ui_ele.get("src", ""))
                 openapi_spec_url.append({"url": cur_url, "name": cur_name})
 
             # only use options from first grouped swagger ui tag
-            render_template(
-                openapi_spec_url=openapi_spec_url, swagger_ui_ele=grouped_list[0]
+            cur_id, iframe_filename = render_template(
+                openapi_spec_url=openapi_spec_url,
+                swagger_ui_ele=grouped_list[0][1],
+            )
+            replacement_list.append(
+                (
+                    grouped_list[0][0],
+                    iframe_template.format(id=cur_id, src=iframe_filename),
+                )
             )
             # only keep first grouped swagger ui tag
-            for rest_swagger_ui_ele in grouped_list[1:]:
-                rest_swagger_ui_ele.extract()
+            for rest_match, _ in grouped_list[1:]:
+                replacement_list.append((rest_match, ""))
 
-        js_code = soup.new_tag("script")
+        # Nothing was replaced, keep the page untouched and skip the script
+        if not replacement_list:
+            return output
+
+        # Splice the replacements and the script into the original output
+        # in a single pass over the recorded match offsets, instead of one
+        # O(page) replace per tag. Grouped tags are appended out of source
+        # order, so sort by position first.
+        replacement_list.sort(key=lambda item: item[0].start())
+        fragments = []
+        pos = 0
+        for match, replacement in replacement_list:
+            fragments.append(output[pos : match.start()])
+            if replacement:
+                fragments.append(replacement)
+            pos = match.end()
+        body_close = output.find("</body>", pos)
+        if body_close == -1:
+            fragments.append(output[pos:])
+        else:
+            fragments.append(output[pos:body_close])
+            fragments.append(self.script_html)
+            fragments.append(output[body_close:])
+
+        return "".join(fragments)
+
+    def build_script_html(self, config):
+        """Build the per-page helper script, invariant during a build
+
+        The script is shipped as-is: its exact text is part of the page
+        format the test suite checks, so it is not run through a minifier.
+        """
         # trigger from iframe body ResizeObserver
-        js_code.string = """
+        js_code = """
             window.update_swagger_ui_iframe_height = function (id) {
                 var iFrameID = document.getElementById(id);
                 if (iFrameID) {
@@ -236,7 +466,7 @@ class SwaggerUIPlugin(BasePlugin):
             }
         """
         # listen scroll event to update modal position in iframe
-        js_code.string += """
+        js_code += """
             let iframe_id_list = []
             var iframes = document.getElementsByClassName("swagger-ui-iframe");
             for (var i = 0; i < iframes.length; i++) {
@@ -265,10 +495,10 @@ class SwaggerUIPlugin(BasePlugin):
         """
         if config["theme"].name == "material":
             # synchronized dark mode with mkdocs-material
-            js_code.string += f"""
+            js_code += f"""
             const dark_scheme_name = "{self.config["dark_scheme_name"]}"
             """
-            js_code.string += """
+            js_code += """
             const schemeAttr = document.body.getAttribute("data-md-color-scheme");
             const isMediaPrefersScheme = document.body.getAttribute("data-md-color-media") === "(prefers-color-scheme: dark)";
 
@@ -303,56 +533,56 @@ class SwaggerUIPlugin(BasePlugin):
             observer.observe(document.body, options);
             """
             # support compatible with mkdocs-material Instant loading feature
-            js_code.string = "document$.subscribe(() => {" + js_code.string + "})"
-        soup.body.append(js_code)
-
-        return str(soup)
-
-    def replace_with_iframe(self, soup, swagger_ui_ele, cur_id, iframe_filename):
-        """Replace swagger-ui tag with iframe"""
-        iframe = soup.new_tag("iframe")
-        iframe["id"] = cur_id
-        iframe["src"] = iframe_filename
-        iframe["frameborder"] = "0"
-        iframe["style"] = "display:none;"
-        iframe["width"] = "100%"
-        iframe["class"] = "swagger-ui-iframe"
-        iframe["onload"] = (
-            "this.style.display = 'block'; this.style.overflow = 'hidden'; this.style.width = '100%';"
-        )
-        swagger_ui_ele.replace_with(iframe)
+            js_code = "document$.subscribe(() => {" + js_code + "})"
+        return "<script>" + js_code + "</script>"
+
+    @staticmethod
+    def coerce_submit_methods(val):
+        """Parse a supportedSubmitMethods attribute value into a list"""
+        try:
+            val = json.loads(val.replace("'", '"'))
+            if not isinstance(val, list):
+                raise ValueError(
+                    f"Attribute supportedSubmitMethods: {val} is not a list."
+                )
+            return val
+        except Exception as e:
+            logging.warning(e)
+            logging.warning("Ignore supportedSubmitMethods attribute setting.")
+            return None
+
+    @staticmethod
+    def coerce_query_params(val):
+        """Parse an additionalQueryStringParams attribute value into a dict"""
+        try:
+            val = json.loads(val.replace("'", '"'))
+            if not isinstance(val, dict):
+                raise ValueError(
+                    f"attribute additionalQueryStringParams: {val} is not a dict."
+                )
+            return val
+        except Exception as e:
+            logging.warning(e)
+            logging.warning("Ignore additionalQueryStringParams attribute setting.")
+            return None
+
+    @staticmethod
+    def coerce_bool(val):
+        """Parse a boolean attribute value"""
+        return val.lower().strip() == "true"
 
     def process_options(self, config, swagger_ui_ele):
         """Retrieve Swagger UI options from attribute and use config options as default"""
-        skip_option_keys = ["background", "custom_css_files"]
-        global_options = {
-            k: v for k, v in dict(self.config).items() if k not in skip_option_keys
-        }
-        options_keys = global_options.keys()
+        attrs = swagger_ui_ele.attrs
         cur_options = {}
-        for k in options_keys:
-            val = swagger_ui_ele.get(k.lower(), None)
+        for key, attr_name, coerce in self.option_specs:
+            val = attrs.get(attr_name)
+            if val is None:
+                val = self.global_options[key]
+            elif coerce is not None:
+                val = coerce(val)
             if val is not None:
-                if k == "supportedSubmitMethods":
-                    try:
-                        val = json.loads(val.replace("'", '"'))
-                        if not isinstance(val, list):
-                            raise ValueError(
-                                f"Attribute supportedSubmitMethods: {val} is not a list."
-                            )
-                        cur_options[k] = val
-                    except Exception as e:
-                        logging.warning(e)
-                        logging.warning(
-                            "Ignore supportedSubmitMethods attribute setting."
-                        )
-                        cur_options[k] = None
-                else:
-                    cur_options[k] = val
-            else:
-                cur_options[k] = global_options[k]
-            if cur_options[k] is None:
-                cur_options.pop(k)
+                cur_options[key] = val
         if "syntaxHighlightTheme" in cur_options:
             cur_options["syntaxHighlight.theme"] = cur_options.pop(
                 "syntaxHighlightTheme"
@@ -361,69 +591,59 @@ class SwaggerUIPlugin(BasePlugin):
 
     def process_oath2_prop(self, swagger_ui_ele):
         """Retrieve Swagger UI OAuth 2.0 configuration from tag attributes"""
-        oath_prop_keys = [
-            "clientId",
-            "clientSecret",
-            "realm",
-            "appName",
-            "scopes",
-            "additionalQueryStringParams",
-            "useBasicAuthenticationWithAccessCodeGrant",
-            "usePkceWithAuthorizationCodeGrant",
-        ]
+        attrs = swagger_ui_ele.attrs
         cur_prop = {}
-        for k in oath_prop_keys:
-            val = swagger_ui_ele.get(k.lower(), None)
+        for key, attr_name, coerce in self.oath2_prop_specs:
+            val = attrs.get(attr_name)
             if val is not None:
-                if k == "additionalQueryStringParams":
-                    try:
-                        val = json.loads(val.replace("'", '"'))
-                        if not isinstance(val, dict):
-                            raise ValueError(
-                                f"attribute additionalQueryStringParams: {val} is not a dict."
-                            )
-                        cur_prop[k] = val
-                    except Exception as e:
-                        logging.warning(e)
-                        logging.warning(
-                            "Ignore additionalQueryStringParams attribute setting."
-                        )
-                elif k in [
-                    "useBasicAuthenticationWithAccessCodeGrant",
-                    "usePkceWithAuthorizationCodeGrant",
-                ]:
-                    cur_prop[k] = val.lower().strip() == "true"
-                else:
-                    cur_prop[k] = val
+                if coerce is not None:
+                    val = coerce(val)
+                if val is not None:
+                    cur_prop[key] = val
         return cur_prop
 
+    @staticmethod
+    def write_iframe_file(iframe_path, content):
+        """Write a rendered iframe document to the site directory"""
+        with open(iframe_path, "wb") as f:
+            f.write(content)
+
     def on_post_build(self, *, config):
         """Copy Swagger UI css and js files to assets directory"""
 
+        # make sure every iframe file hit the disk before the build ends
+        for future in self.write_futures:
+            future.result()
+        self.write_futures = []
+        self.write_executor.shutdown()
+
         log.info("Copying swagger ui assets.")
         output_base_path = os.path.join(config["site_dir"], "assets")
+        # scandir keeps the file type from the directory read and
+        # shutil.copyfile takes the zero-copy fast path on Linux
         css_path = os.path.join(output_base_path, "stylesheets")
-        for file_name in os.listdir(
+        os.makedirs(css_path, exist_ok=True)
+        with os.scandir(
             os.path.join(base_path, "swagger-ui", "stylesheets")
-        ):
-            utils.copy_file(
-                os.path.join(base_path, "swagger-ui", "stylesheets", file_name),
-                os.path.join(css_path, file_name),
-            )
+        ) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    shutil.copyfile(
+                        entry.path, os.path.join(css_path, entry.name)
+                    )
 
         js_path = os.path.join(output_base_path, "javascripts")
-        for file_name in os.listdir(
+        os.makedirs(js_path, exist_ok=True)
+        with os.scandir(
             os.path.join(base_path, "swagger-ui", "javascripts")
-        ):
-            utils.copy_file(
-                os.path.join(base_path, "swagger-ui", "javascripts", file_name),
-                os.path.join(js_path, file_name),
-            )
+        ) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    shutil.copyfile(entry.path, os.path.join(js_path, entry.name))
 
         swagger_ui_path = os.path.join(output_base_path, "swagger-ui")
-        if not os.path.exists(swagger_ui_path):
-            os.mkdir(swagger_ui_path)
-        utils.copy_file(
+        os.makedirs(swagger_ui_path, exist_ok=True)
+        shutil.copyfile(
             os.path.join(base_path, "swagger-ui", "oauth2-redirect.html"),
             os.path.join(swagger_ui_path, "oauth2-redirect.html"),
         )
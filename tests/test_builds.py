@@ -372,6 +372,29 @@ def test_multiple(tmp_path):
             assert regex_obj.group(1) == "https://petstore.swagger.io/v2/swagger.json"
 
 
+def test_tag_forms(tmp_path):
+    """
+    Validate self-closing, explicitly closed, unclosed and commented-out tags
+    """
+    mkdocs_file = "mkdocs.yml"
+    testproject_path = validate_mkdocs_file(tmp_path, f"tests/fixtures/{mkdocs_file}")
+    file = testproject_path / "site/tag_forms/index.html"
+    contents = file.read_text(encoding="utf8")
+
+    # self-closing, explicitly closed and unclosed tags all render
+    iframe_content_list = validate_iframe(contents, file.parent)
+    assert len(iframe_content_list) == 3
+    validate_additional_script_code(contents)
+
+    # the commented-out tag is left untouched and renders nothing
+    assert (
+        '<!-- <swagger-ui src="./openapi-spec/sample-third.yaml"/> -->' in contents
+    )
+    for iframe_contents in iframe_content_list:
+        assert "sample-third.yaml" not in iframe_contents
+    assert len(list(file.parent.glob("swagger-*.html"))) == 3
+
+
 def test_build_in_multiple(tmp_path):
     """
     Validate Swagger UI build-in multiple feature